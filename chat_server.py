@@ -1,16 +1,31 @@
 import time
 import json
+import logging
+from functools import lru_cache
 from transport.protocol import TransportProtocol
 from transport.connection import Connection
 
+try:
+    # orjson works on bytes directly and is several times faster than the stdlib
+    import orjson
+    encode_json = orjson.dumps
+    decode_json = orjson.loads
+except ImportError:
+    def encode_json(json_obj):
+        return json.dumps(json_obj).encode('utf-8')
+    decode_json = json.loads  # Also accepts UTF-8 bytes, no separate decode step
+
 SERVER_PORT = 12345
 
 # Map conn_id -> Connection object
 clients = {}
 
-# Map "room_name" -> [conn_id, conn_id, ...]
-# We initialize with a 'general' room
-rooms = {"general": []}
+# Map "room_name" -> {conn_id, conn_id, ...}
+# Sets keep membership checks and removals O(1). We initialize with a 'general' room
+rooms = {"general": set()}
+
+# Map conn_id -> "room_name" the client is currently in (reverse index of rooms)
+client_rooms = {}
 
 # Map conn_id -> "Username" (Person 4 will manage this, but I need it for notifications)
 usernames = {}
@@ -25,15 +40,25 @@ def get_username(conn_id):
     # Helper to get a name or default to 'Unknown'
     return usernames.get(conn_id, f"User{conn_id}")
 
+@lru_cache(maxsize=256)
+def info_payload(msg):
+    # INFO notices repeat a lot ("X joined general."), so keep their encoded bytes around
+    return encode_json({"type": "INFO", "msg": msg})
+
 def broadcast(room, json_obj, exclude_conn_id=None):
     # (Person 3's Job, but Person 1 needs it for notifications).
     # Sends a JSON message to everyone in a specific room.
+    broadcast_payload(room, encode_json(json_obj), exclude_conn_id)
+
+def broadcast_info(room, msg, exclude_conn_id=None):
+    # Sends an INFO notice to everyone in a room, reusing the cached encoding
+    broadcast_payload(room, info_payload(msg), exclude_conn_id)
 
+def broadcast_payload(room, payload, exclude_conn_id=None):
+    # Sends already-encoded JSON bytes to everyone in a room.
     if room not in rooms:
         return
 
-    payload = json.dumps(json_obj).encode('utf-8')
-    
     # Loop through all connection IDs in the room
     for cid in rooms[room]:
         if cid == exclude_conn_id:
@@ -55,8 +80,7 @@ def handle_login(conn, data):
     usernames[conn.conn_id] = name
     
     # Send welcome
-    welcome = {"type": "INFO", "msg": f"Welcome {name}!"}
-    protocol.send_msg(conn, json.dumps(welcome).encode('utf-8'))
+    protocol.send_msg(conn, info_payload(f"Welcome {name}!"))
     
     # Auto-join general
     handle_join(conn, {"room": "general"})
@@ -72,27 +96,25 @@ def handle_join(conn, data):
         return
 
     # 1. Leave current room first (cleanup)
-    # We iterate to find where they currently are
-    for r_name, members in rooms.items():
-        if conn.conn_id in members:
-            # remove them from the old room
-            members.remove(conn.conn_id)
-            # Notify old room
-            old_msg = {"type": "INFO", "msg": f"{get_username(conn.conn_id)} left."}
-            broadcast(r_name, old_msg)
-            break
+    # The reverse index tells us where they currently are
+    old_room = client_rooms.pop(conn.conn_id, None)
+    if old_room is not None:
+        # remove them from the old room
+        rooms[old_room].discard(conn.conn_id)
+        # Notify old room
+        broadcast_info(old_room, f"{get_username(conn.conn_id)} left.")
 
     # 2. Create room if it doesn't exist
     if room_name not in rooms:
-        rooms[room_name] = []
+        rooms[room_name] = set()
 
     # 3. Add to new room
-    rooms[room_name].append(conn.conn_id)
+    rooms[room_name].add(conn.conn_id)
+    client_rooms[conn.conn_id] = room_name
     print(f"[Server] {conn.conn_id} joined room '{room_name}'")
 
     # 4. Notify new room
-    join_msg = {"type": "INFO", "msg": f"{get_username(conn.conn_id)} joined {room_name}."}
-    broadcast(room_name, join_msg)
+    broadcast_info(room_name, f"{get_username(conn.conn_id)} joined {room_name}.")
 
 
 def handle_leave(conn, data):
@@ -100,11 +122,11 @@ def handle_leave(conn, data):
     room_name = data.get('room')
     if room_name and room_name in rooms:
         if conn.conn_id in rooms[room_name]:
-            rooms[room_name].remove(conn.conn_id)
-            
+            rooms[room_name].discard(conn.conn_id)
+            client_rooms.pop(conn.conn_id, None)
+
             # Notify room
-            msg = {"type": "INFO", "msg": f"{get_username(conn.conn_id)} left {room_name}."}
-            broadcast(room_name, msg)
+            broadcast_info(room_name, f"{get_username(conn.conn_id)} left {room_name}.")
 
 
 def handle_msg(conn, data):
@@ -126,19 +148,27 @@ def handle_dm(conn, data):
 
 # Main dispatcher
 
+# Map "type" field -> handler; one dict lookup instead of an if/elif chain
+MESSAGE_HANDLERS = {
+    "LOGIN": handle_login,
+    "JOIN": handle_join,
+    "LEAVE": handle_leave,
+    "MSG": handle_msg,
+    "DM": handle_dm,
+}
+
 def process_message(conn: Connection, raw_data: bytes):
     """Decodes raw bytes to JSON and calls the right handler."""
     try:
-        payload = json.loads(raw_data.decode('utf-8'))
+        payload = decode_json(raw_data)
         msg_type = payload.get("type")
         
         # Dispatcher logic
-        if msg_type == "LOGIN": handle_login(conn, payload)
-        elif msg_type == "JOIN": handle_join(conn, payload)
-        elif msg_type == "LEAVE": handle_leave(conn, payload)
-        elif msg_type == "MSG": handle_msg(conn, payload)
-        elif msg_type == "DM": handle_dm(conn, payload)
-        else: print(f"Unknown message type: {msg_type}")
+        handler = MESSAGE_HANDLERS.get(msg_type)
+        if handler:
+            handler(conn, payload)
+        else:
+            print(f"Unknown message type: {msg_type}")
 
     except Exception as e:
         print(f"Error processing message from {conn.conn_id}: {e}")
@@ -164,18 +194,19 @@ def on_client_disconnect(conn: Connection):
     if cid in clients:
         del clients[cid]
 
-    # 2. Remove from rooms and notify others
-    for r_name, members in rooms.items():
-        if cid in members:
-            members.remove(cid)
-            msg = {"type": "INFO", "msg": f"{get_username(cid)} disconnected."}
-            broadcast(r_name, msg)
+    # 2. Remove from their room and notify others
+    r_name = client_rooms.pop(cid, None)
+    if r_name is not None:
+        rooms[r_name].discard(cid)
+        broadcast_info(r_name, f"{get_username(cid)} disconnected.")
 
     # 3. Remove username
     if cid in usernames:
         del usernames[cid]
 
 if __name__ == "__main__":
+    # Show the transport's connection lifecycle messages; per-packet detail stays at DEBUG
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     protocol = TransportProtocol(local_port=SERVER_PORT)
     protocol.on_new_connection(on_new_client)
     protocol.start()
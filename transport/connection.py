@@ -1,9 +1,13 @@
 from enum import Enum, auto
 from typing import Callable, Optional
+import logging
+import threading
 import time
 from .receiver import ReceiverLogic
 from .sender import SenderLogic
 
+log = logging.getLogger(__name__)
+
 class ConnectionState(Enum):
     # Manages the state of a single connection 
     LISTENING = auto()  # Server only, waiting for SYN
@@ -15,6 +19,20 @@ class ConnectionState(Enum):
 
 class Connection:
     # Holds all state for a single connection. This object is the "brain" for one client-server relationship.
+    # __slots__ drops the per-instance __dict__, keeping connections small when a server holds many of them.
+    __slots__ = (
+        "protocol",
+        "conn_id",
+        "peer_address",
+        "state",
+        "last_active_time",
+        "established_event",
+        "on_message_callback",
+        "on_disconnect_callback",
+        "receiver",
+        "sender",
+    )
+
     def __init__(self, protocol, conn_id: int, peer_address: tuple[str, int], 
                  initial_state: ConnectionState):
         # Use tuple[str, int] for modern Python type hints
@@ -22,7 +40,8 @@ class Connection:
         self.conn_id = conn_id
         self.peer_address = peer_address
         self.state = initial_state
-        self.last_active_time = time.time()
+        self.last_active_time = time.monotonic_ns()  # Integer ns; immune to wall-clock steps
+        self.established_event = threading.Event()  # Set when the handshake completes
         
         # Application callbacks
         self.on_message_callback: Optional[Callable[[bytes], None]] = None
@@ -34,11 +53,11 @@ class Connection:
         self.receiver = ReceiverLogic(self)
         self.sender = SenderLogic(self)
 
-        print(f"[Conn {self.conn_id}] New connection to {peer_address}, state={self.state.name}")
+        log.debug("[Conn %d] New connection to %s, state=%s", conn_id, peer_address, initial_state.name)
 
     def update_activity(self):
         # Updates the last active time
-        self.last_active_time = time.time()
+        self.last_active_time = time.monotonic_ns()
 
     def deliver_data_to_app(self, data: bytes):
         # Called by Part 3 (ReceiverLogic) when contiguous data is ready. This triggers the application's registered callback.
@@ -46,12 +65,43 @@ class Connection:
             try:
                 self.on_message_callback(data)
             except Exception as e:
-                print(f"[Conn {self.conn_id}] Error in on_message_callback: {e}")
-        else:
-            print(f"[Conn {self.conn_id}] No on_message_callback registered. Dropping data.")
+                log.error("[Conn %d] Error in on_message_callback: %s", self.conn_id, e)
+        elif log.isEnabledFor(logging.DEBUG):
+            log.debug("[Conn %d] No on_message_callback registered. Dropping data.", self.conn_id)
 
     def _internal_send(self, header, payload: bytes):
         # Provides a single, unified send function for Parts 3 & 4. This calls the main protocol's private send method.
         # Set the correct conn_id and peer_address for sending
         header.conn_id = self.conn_id
         self.protocol._send_raw_packet(header, payload, self.peer_address)
+
+
+SHARD_COUNT = 64  # Must be a power of two; shard index is hash(addr) & (SHARD_COUNT - 1)
+
+
+class ShardedConnMap:
+    # Maps peer address (ip, port) -> Connection, split into independently locked shards.
+    # Lookups are lock-free (a single dict.get is atomic under the GIL), which keeps the
+    # listener's per-packet routing cheap. Inserts and removals lock only their own shard,
+    # so connect/close on one address never waits on another.
+    __slots__ = ("shards",)
+
+    def __init__(self):
+        self.shards = [({}, threading.Lock()) for _ in range(SHARD_COUNT)]
+
+    def _shard(self, addr: tuple[str, int]):
+        return self.shards[hash(addr) & (SHARD_COUNT - 1)]
+
+    def get(self, addr: tuple[str, int]) -> Optional[Connection]:
+        return self._shard(addr)[0].get(addr)
+
+    def put(self, addr: tuple[str, int], conn: Connection):
+        shard, lock = self._shard(addr)
+        with lock:
+            shard[addr] = conn
+
+    def pop(self, addr: tuple[str, int]) -> Optional[Connection]:
+        # Removes and returns the connection for addr, or None if there is none
+        shard, lock = self._shard(addr)
+        with lock:
+            return shard.pop(addr, None)
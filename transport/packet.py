@@ -3,6 +3,11 @@ import struct
 import socket
 from dataclasses import dataclass
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; calculate_checksum works without it
+    np = None
+
 # =======================
 # ---- CONSTANTS ----
 # =======================
@@ -15,7 +20,15 @@ FLAG_PSH = 0x08
 # ---- HEADER SETUP ----
 # =======================
 HEADER_FORMAT = "!HHLLLHHH"
-HEADER_LEN = struct.calcsize(HEADER_FORMAT)
+_HDR = struct.Struct(HEADER_FORMAT)  # Compiled once instead of re-parsing the format per packet
+HEADER_LEN = _HDR.size
+
+# ack, rwnd, length, checksum: the tail of the header, rewritten in place by AckTemplate
+_ACK_TAIL = struct.Struct("!LHHH")
+_ACK_TAIL_OFFSET = HEADER_LEN - _ACK_TAIL.size
+
+# Below this size the integer fold in calculate_checksum beats NumPy's call overhead
+NUMPY_CHECKSUM_MIN_LEN = 1024
 
 @dataclass
 class TransportHeader:
@@ -34,15 +47,23 @@ class TransportHeader:
 # =======================
 def calculate_checksum(data: bytes) -> int:
     """Compute 16-bit Internet checksum."""
+    if np is not None and len(data) >= NUMPY_CHECKSUM_MIN_LEN:
+        if len(data) % 2:
+            data = bytes(data) + b'\x00'
+        # Sum all big-endian 16-bit words in one C loop, then fold the carries back in
+        checksum = int(np.frombuffer(data, dtype='>u2').sum(dtype=np.uint64))
+        while checksum >> 16:
+            checksum = (checksum & 0xFFFF) + (checksum >> 16)
+        return ~checksum & 0xFFFF
+
+    # 0x10000 == 1 (mod 0xFFFF), so the buffer read as one big-endian integer has the
+    # same residue as the one's-complement sum of its 16-bit words (RFC 1071).
+    total = int.from_bytes(data, 'big')
     if len(data) % 2:
-        data += b'\x00'
-
-    checksum = 0
-    for i in range(0, len(data), 2):
-        word = (data[i] << 8) + data[i + 1]
-        checksum += word
-        checksum = (checksum & 0xFFFF) + (checksum >> 16)
-
+        total <<= 8  # Pad odd-length data with a zero byte without copying it
+    checksum = total % 0xFFFF
+    if checksum == 0 and total:
+        checksum = 0xFFFF  # A non-zero sum folds to 0xFFFF, never to 0
     return ~checksum & 0xFFFF
 
 
@@ -57,8 +78,7 @@ def verify_checksum(packet_data: bytes) -> bool:
 def serialize_packet(header: TransportHeader, payload: bytes) -> bytes:
     """Convert header + payload into bytes with a correct checksum."""
     # First pack with checksum = 0
-    temp_header = struct.pack(
-        HEADER_FORMAT,
+    temp_header = _HDR.pack(
         header.ver, header.flags, header.conn_id, header.seq,
         header.ack, header.rwnd, header.length, 0
     )
@@ -68,22 +88,65 @@ def serialize_packet(header: TransportHeader, payload: bytes) -> bytes:
     checksum = calculate_checksum(packet)
 
     # Repack header with correct checksum
-    final_header = struct.pack(
-        HEADER_FORMAT,
+    final_header = _HDR.pack(
         header.ver, header.flags, header.conn_id, header.seq,
         header.ack, header.rwnd, header.length, checksum
     )
     return final_header + payload
 
 
-def deserialize_packet(data: bytes) -> tuple[TransportHeader, bytes]:
-    """Extract header and payload from raw bytes."""
-    fields = struct.unpack(HEADER_FORMAT, data[:HEADER_LEN])
+def serialize_fields(flags: int, conn_id: int, seq: int, ack: int, rwnd: int, payload) -> bytes:
+    """Like serialize_packet, but from plain field values (ver=1, length=len(payload)).
+
+    Used on the data send path so no TransportHeader is built per packet.
+    """
+    length = len(payload)
+    checksum = calculate_checksum(_HDR.pack(1, flags, conn_id, seq, ack, rwnd, length, 0) + payload)
+    return _HDR.pack(1, flags, conn_id, seq, ack, rwnd, length, checksum) + payload
+
+
+def deserialize_packet(data: bytes) -> tuple[TransportHeader, memoryview]:
+    """Extract header and payload from raw bytes.
+
+    The payload is a zero-copy view into data; call bytes() on it only if it must be kept.
+    """
+    fields = _HDR.unpack_from(data, 0)
     header = TransportHeader(*fields)
-    payload = data[HEADER_LEN:]
+    payload = memoryview(data)[HEADER_LEN:]
     return header, payload
 
 
+def unpack_header(data: bytes) -> tuple[int, int, int, int, int, int, int, int]:
+    """Return the raw header fields (ver, flags, conn_id, seq, ack, rwnd, length, checksum).
+
+    Used on the receive path, where building a TransportHeader per packet is wasted work.
+    """
+    return _HDR.unpack_from(data, 0)
+
+
+class AckTemplate:
+    """Pre-serialized pure ACK for one connection.
+
+    Only ack, rwnd and the checksum change between ACKs, so fill() patches those bytes in
+    place and updates the checksum incrementally instead of re-serializing the header.
+    """
+    __slots__ = ("conn_id", "buf", "_base_sum")
+
+    def __init__(self, conn_id: int):
+        self.conn_id = conn_id
+        self.buf = bytearray(_HDR.pack(1, FLAG_ACK, conn_id, 0, 0, 0, 0, 0))
+        # One's-complement sum of the fixed fields (ver, flags, conn_id, seq), carries unfolded
+        self._base_sum = sum(struct.unpack_from("!%dH" % (_ACK_TAIL_OFFSET // 2), self.buf))
+
+    def fill(self, ack: int, rwnd: int) -> bytearray:
+        """Write ack/rwnd and the matching checksum into buf and return it."""
+        total = self._base_sum + (ack >> 16) + (ack & 0xFFFF) + rwnd
+        total = (total & 0xFFFF) + (total >> 16)
+        total = (total & 0xFFFF) + (total >> 16)
+        _ACK_TAIL.pack_into(self.buf, _ACK_TAIL_OFFSET, ack, rwnd, 0, ~total & 0xFFFF)
+        return self.buf
+
+
 # =======================
 # ---- UDP I/O ----
 # =======================
@@ -1,20 +1,39 @@
+import logging
+import os
+import selectors
 import socket
 import threading
 import time
-import random
-from typing import Callable, Dict, Tuple
+import itertools
+import secrets
+from typing import Callable, Optional, Sequence, Tuple
 
 from .packet import (
     TransportHeader,
     serialize_packet,
-    deserialize_packet,
+    unpack_header,
     verify_checksum,
+    HEADER_LEN,
     FLAG_SYN,
     FLAG_ACK,
     FLAG_FIN,
     FLAG_PSH,
 )
-from .connection import Connection, ConnectionState
+from .connection import Connection, ConnectionState, ShardedConnMap
+
+log = logging.getLogger(__name__)
+
+RECV_BUFSIZE = 65535      # Large enough for any UDP datagram
+RECV_BATCH = 64           # Max datagrams handled per wakeup before ACKs are flushed
+ACK_DELAY_NS = 2_000_000  # A lone in-order segment is ACKed at most 2 ms late
+SOCKET_BUFFER_SIZE = 1 << 20  # Kernel send/receive buffers; absorbs bursts between wakeups
+
+# Module-level aliases so the per-packet router avoids enum attribute lookups
+_ESTABLISHED = ConnectionState.ESTABLISHED
+_SYN_SENT = ConnectionState.SYN_SENT
+_SYN_RECV = ConnectionState.SYN_RECV
+_FIN_WAIT = ConnectionState.FIN_WAIT
+_FLAGS_SYN_ACK = FLAG_SYN | FLAG_ACK
 
 
 class TransportProtocol:
@@ -22,159 +41,309 @@ class TransportProtocol:
     # This class owns the UDP socket, manages all connections, and routes incoming packets.
     # It orchestrates the handshake, data transfer, and teardown processes.
 
-    def __init__(self, local_port: int):
+    def __init__(self, local_port: int, listeners: int = 1,
+                 listen_cores: Optional[Sequence[int]] = None):
+        # listeners > 1 binds that many SO_REUSEPORT sockets to local_port, each drained by its
+        # own thread. The kernel hashes each peer to one socket, so a connection stays on one
+        # listener. Requires a fixed (non-zero) local_port and Linux/BSD SO_REUSEPORT.
+        # listen_cores pins listener i to CPU listen_cores[i % len(listen_cores)] (Linux only),
+        # keeping its socket and connection state hot in one core's cache. Leave the core that
+        # services the NIC interrupts out of the list.
+        if listeners > 1 and (not local_port or not hasattr(socket, "SO_REUSEPORT")):
+            raise ValueError("Multiple listeners need a fixed port and SO_REUSEPORT support")
         self.local_port = local_port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listen_cores = list(listen_cores) if listen_cores else []
+        self.socks = [self._make_socket(listeners > 1) for _ in range(listeners)]
+        self.sock = self.socks[0]  # All outgoing packets leave through the first socket
         self.running = False
-        self.listen_thread = None
+        self.listen_threads = []
+        self._wake_r = self._wake_w = None  # stop() writes here to wake every listener's selector
+        self.dropped_packets = 0  # Runt or corrupt datagrams discarded by the listener
+        # Server-side conn_id source: random start, then sequential, so ids never repeat until
+        # the 32-bit space wraps. next() on a count is atomic, so several listeners can share it.
+        self._conn_ids = itertools.count(secrets.randbits(32) | 1)
 
         # Maps peer address (ip, port) to the corresponding Connection object
-        self.connections: Dict[Tuple[str, int], Connection] = {}
+        self.connections = ShardedConnMap()
 
         # Server-side: Callback for when a new client connection is established
         self.on_new_connection: Callable[[Connection], None] = None
 
+    @staticmethod
+    def _make_socket(reuse_port: bool) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # The kernel clamps these to net.core.rmem_max / wmem_max
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return sock
+
     def start(self):
-        """Binds the socket and starts the main listener thread."""
+        """Binds the socket(s) and starts one listener thread per socket."""
         try:
-            self.sock.bind(("", self.local_port))
-            print(f"Socket bound to port {self.local_port}")
+            for sock in self.socks:
+                sock.bind(("", self.local_port))
+            log.info("Socket bound to port %d", self.local_port)
         except OSError as e:
-            print(f"Failed to bind socket: {e}")
+            log.error("Failed to bind socket: %s", e)
             return
 
         self.running = True
-        self.listen_thread = threading.Thread(target=self._listen_loop, daemon=True)
-        self.listen_thread.start()
-        print("Protocol listener started.")
+        self._wake_r, self._wake_w = self._open_wakeup()
+        for sock in self.socks:
+            # The listener waits on its selector and drains the socket without blocking
+            sock.setblocking(False)
+            thread = threading.Thread(target=self._listen_loop, args=(sock,), daemon=True)
+            thread.start()
+            if self.listen_cores:
+                core = self.listen_cores[len(self.listen_threads) % len(self.listen_cores)]
+                self._pin_thread(thread, core)
+            self.listen_threads.append(thread)
+        log.info("Protocol listener started (%d thread(s)).", len(self.socks))
+
+    @staticmethod
+    def _pin_thread(thread: threading.Thread, core: int):
+        # Restricts one thread (not the whole process) to a single CPU
+        if not hasattr(os, "sched_setaffinity"):
+            log.warning("CPU pinning is not supported on this platform; ignoring listen_cores.")
+            return
+        try:
+            os.sched_setaffinity(thread.native_id, {core})
+        except OSError as e:
+            log.warning("Could not pin listener to CPU %d: %s", core, e)
+
+    @staticmethod
+    def _open_wakeup() -> Tuple[int, int]:
+        # Returns (read_fd, write_fd). An eventfd is one descriptor for both ends; other
+        # platforms fall back to a self-pipe.
+        if hasattr(os, "eventfd"):
+            fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            return fd, fd
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        return read_fd, write_fd
 
     def stop(self):
-        # Stops the listener thread and closes the socket.
+        # Stops the listener threads and closes the sockets.
         self.running = False
-        # Closing the socket will cause recvfrom to raise an exception, breaking the loop
-        self.sock.close()
-        if self.listen_thread:
-            self.listen_thread.join()
-        print("Protocol listener stopped.")
-
-    def _listen_loop(self):
-        # Main packet processing loop. Runs in its own thread.
-        # This method acts as the central packet router.
+        if self._wake_w is not None:
+            # Never read, so it stays readable and wakes every listener, including one that
+            # is about to call select()
+            if self._wake_r == self._wake_w:
+                os.eventfd_write(self._wake_w, 1)
+            else:
+                os.write(self._wake_w, b"\0")
+        for thread in self.listen_threads:
+            thread.join()
+        self.listen_threads = []
+        if self._wake_w is not None:
+            for fd in {self._wake_r, self._wake_w}:
+                os.close(fd)
+            self._wake_r = self._wake_w = None
+        for sock in self.socks:
+            sock.close()
+        log.info("Protocol listener stopped.")
+
+    def _listen_loop(self, sock: socket.socket):
+        # Main packet processing loop. Runs in its own thread, one per socket.
+        # Sleeps in the selector until the socket is readable, then drains up to RECV_BATCH
+        # queued datagrams, so a burst costs one wakeup instead of one per packet.
+        # Data packets in the batch are acknowledged once per connection at the end, or, for a
+        # single in-order segment, up to ACK_DELAY_NS later. The select timeout doubles as the
+        # delayed-ACK timer, so no per-ACK timer threads are needed.
+        # stop() wakes the selector through the wakeup fd, so with no delayed ACK pending the
+        # listener sleeps until there is work instead of polling on a timeout.
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        delayed_acks = {}  # Connection -> monotonic_ns deadline for its delayed ACK
         while self.running:
+            timeout = None
+            if delayed_acks:
+                wait_ns = min(delayed_acks.values()) - time.monotonic_ns()
+                timeout = max(wait_ns, 0) / 1e9
             try:
-                # 1. Read from the wire
-                raw_data, sender_addr = self.sock.recvfrom(2048)
-
-                # 2. Verify checksum before doing anything else
-                if not verify_checksum(raw_data):
-                    print(f"Dropping corrupt packet from {sender_addr}")
-                    continue
-
-                # 3. Deserialize the packet
-                header, payload = deserialize_packet(raw_data)
-                if not header:
-                    print(f"Dropping malformed packet from {sender_addr}")
-                    continue
-
-                # 4. Route the packet based on sender and flags
-                conn = self.connections.get(sender_addr)
-
-                if conn:
-                    # Existing Connection
-                    if conn.state == ConnectionState.SYN_SENT and header.flags == (FLAG_SYN | FLAG_ACK):
-                        self._handle_syn_ack(conn, header, sender_addr)
-                    elif conn.state == ConnectionState.SYN_RECV and header.flags == FLAG_ACK:
-                        self._handle_handshake_ack(conn, header)
-                    elif conn.state == ConnectionState.ESTABLISHED:
-                        if header.flags & FLAG_FIN:
-                            self._handle_fin(conn, header)
-                        if header.flags & FLAG_ACK:
-                            conn.sender.process_incoming_ack(header)
-                        if payload or (header.flags & FLAG_PSH):
-                            conn.receiver.process_data_packet(header, payload)
-                    # Other states (like FIN_WAIT) are handled implicitly by ACK/FIN checks
-                elif header.flags == FLAG_SYN:
-                    # New Connection Request 
-                    self._handle_new_syn(header, sender_addr)
-                else:
-                    print(f"Dropping packet from unknown source: {sender_addr}")
-
-            except socket.error:
-                # This is expected when self.sock.close() is called in stop()
-                if not self.running:
-                    break  # Graceful exit
-                else:
-                    print("Socket error in listener.")
-                    break
-        print("Listen loop exiting.")
+                events = selector.select(timeout=timeout)
+            except OSError:
+                log.error("Selector error in listener.")
+                break
+            if not self.running:
+                break  # Woken by stop()
+
+            # One clock read per wakeup; every packet drained below shares the timestamp
+            now = time.monotonic_ns()
+            if events:
+                acks_due = set()  # Connections that received data in this batch
+                try:
+                    for _ in range(RECV_BATCH):
+                        raw_data, sender_addr = sock.recvfrom(RECV_BUFSIZE)
+                        self._handle_packet(raw_data, sender_addr, now, acks_due)
+                except BlockingIOError:
+                    pass  # Kernel buffer drained
+                except socket.error:
+                    if not self.running:
+                        break  # Graceful exit
+                    else:
+                        log.error("Socket error in listener.")
+                        break
+
+                # One cumulative ACK per connection for everything drained above
+                for conn in acks_due:
+                    if conn.receiver.ack_due_now():
+                        delayed_acks.pop(conn, None)
+                        conn.receiver.flush_ack()
+                    else:
+                        delayed_acks.setdefault(conn, now + ACK_DELAY_NS)
+
+            if delayed_acks:
+                for conn, deadline in list(delayed_acks.items()):
+                    if deadline <= now:
+                        del delayed_acks[conn]
+                        if conn.state is _ESTABLISHED:
+                            conn.receiver.flush_ack()
+        selector.close()
+        log.debug("Listen loop exiting.")
+
+    def _handle_packet(self, raw_data: bytes, sender_addr: Tuple[str, int], now: int, acks_due: set):
+        # This method acts as the central packet router.
+        # 1. Check length and checksum on the raw buffer, before any parsing or allocation
+        if len(raw_data) < HEADER_LEN:
+            self.dropped_packets += 1
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Dropping malformed packet from %s", sender_addr)
+            return
+        if not verify_checksum(raw_data):
+            self.dropped_packets += 1
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Dropping corrupt packet from %s", sender_addr)
+            return
+
+        # 2. Unpack the header straight into locals; no TransportHeader is built per packet
+        _ver, flags, conn_id, seq, ack, rwnd, _length, _checksum = unpack_header(raw_data)
+
+        # 3. Route the packet based on sender and flags
+        conn = self.connections.get(sender_addr)
+
+        if conn:
+            # Existing Connection
+            conn.last_active_time = now
+            state = conn.state
+            # Established traffic is nearly every packet, so it is tested first
+            if state is _ESTABLISHED:
+                if flags & FLAG_FIN:
+                    self._handle_fin(conn, seq)
+                if flags & FLAG_ACK:
+                    conn.sender.process_incoming_ack(ack, rwnd)
+                if len(raw_data) > HEADER_LEN or (flags & FLAG_PSH):
+                    # Zero-copy view of the payload; the receiver copies only what it keeps
+                    conn.receiver.process_data_packet(seq, memoryview(raw_data)[HEADER_LEN:])
+                    acks_due.add(conn)
+            elif state is _SYN_SENT and flags == _FLAGS_SYN_ACK:
+                self._handle_syn_ack(conn, conn_id, seq, sender_addr)
+            elif state is _SYN_RECV and flags == FLAG_ACK:
+                self._handle_handshake_ack(conn)
+            elif state is _FIN_WAIT and flags & FLAG_ACK and ack == conn.sender.next_seq + 1:
+                # Peer acknowledged our FIN (sent with seq=next_seq)
+                self._cleanup_connection(conn)
+        elif flags == FLAG_SYN:
+            # New Connection Request
+            self._handle_new_syn(seq, sender_addr)
+        else:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Dropping packet from unknown source: %s", sender_addr)
 
     def _send_raw_packet(self, header: TransportHeader, payload: bytes, dest_addr: Tuple[str, int]):
         # (Internal) Serializes and sends a single packet to a given destination.
-        # This is the ONLY place in the class where serialize_packet and sock.sendto are called.
         try:
             packet = serialize_packet(header, payload)
+        except Exception as e:
+            log.warning("Error serializing packet for %s: %s", dest_addr, e)
+            return
+        self._send_bytes(packet, dest_addr)
+
+    def _send_bytes(self, packet, dest_addr: Tuple[str, int]):
+        # (Internal) Sends an already-serialized packet (bytes or bytearray).
+        try:
             self.sock.sendto(packet, dest_addr)
         except Exception as e:
-            print(f"Error sending packet to {dest_addr}: {e}")
+            log.warning("Error sending packet to %s: %s", dest_addr, e)
+
+    def _send_raw_batch(self, packets: list, dest_addr: Tuple[str, int]):
+        # (Internal) Sends several serialized packets to one destination back to back.
+        # Python has no sendmmsg, and a ctypes one measured slower than this loop, so the batch
+        # saves per-packet call overhead rather than syscalls. A failed packet stays unacked
+        # and is retransmitted by its timer, so the rest of the batch still goes out.
+        sendto = self.sock.sendto
+        for packet in packets:
+            try:
+                sendto(packet, dest_addr)
+            except Exception as e:
+                log.warning("Error sending packet to %s: %s", dest_addr, e)
 
     # Handshake and Teardown Logic 
 
-    def _handle_new_syn(self, header: TransportHeader, sender_addr: Tuple[str, int]):
+    def _handle_new_syn(self, syn_seq: int, sender_addr: Tuple[str, int]):
         # Server-side: Handles a new SYN packet to establish a connection.
         if not self.on_new_connection:
-            print("Server not configured to accept new connections. Dropping SYN.")
+            log.warning("Server not configured to accept new connections. Dropping SYN.")
             return
 
-        print(f"New SYN received from {sender_addr}")
-        conn_id = random.randint(1, 0xFFFFFFFF)
+        log.info("New SYN received from %s", sender_addr)
+        conn_id = next(self._conn_ids) & 0xFFFFFFFF
+        if conn_id == 0:  # 0 means "not assigned yet" in the SYN; skip it on wrap-around
+            conn_id = next(self._conn_ids) & 0xFFFFFFFF
         conn = Connection(self, conn_id, sender_addr, ConnectionState.SYN_RECV)
-        self.connections[sender_addr] = conn
+        self.connections.put(sender_addr, conn)
 
         # Send SYN-ACK
         syn_ack_header = TransportHeader(
             flags=FLAG_SYN | FLAG_ACK,
             conn_id=conn_id,
             seq=conn.sender.next_seq,
-            ack=header.seq + 1,
+            ack=syn_seq + 1,
             rwnd=conn.receiver.advertised_window,
         )
         self._send_raw_packet(syn_ack_header, b"", sender_addr)
-        print(f"[Conn {conn_id}] Sent SYN-ACK to {sender_addr}.")
+        log.debug("[Conn %d] Sent SYN-ACK to %s.", conn_id, sender_addr)
 
-    def _handle_syn_ack(self, conn: Connection, header: TransportHeader, sender_addr: Tuple[str, int]):
+    def _handle_syn_ack(self, conn: Connection, conn_id: int, syn_seq: int, sender_addr: Tuple[str, int]):
         # Client-side: Handles a SYN-ACK packet from the server.
-        print(f"[Conn {conn.conn_id}] Received SYN-ACK. Connection ESTABLISHED.")
+        log.info("[Conn %d] Received SYN-ACK. Connection ESTABLISHED.", conn.conn_id)
+        conn.conn_id = conn_id  # Set the official connection ID from the server
         conn.state = ConnectionState.ESTABLISHED
-        conn.conn_id = header.conn_id  # Set the official connection ID from the server
+        conn.established_event.set()  # Wakes the thread blocked in connect()
 
         # Send the final ACK of the 3-way handshake
         ack_header = TransportHeader(
             flags=FLAG_ACK,
             conn_id=conn.conn_id,
             seq=conn.sender.next_seq,
-            ack=header.seq + 1,
+            ack=syn_seq + 1,
             rwnd=conn.receiver.advertised_window,
         )
         self._send_raw_packet(ack_header, b"", sender_addr)
 
-    def _handle_handshake_ack(self, conn: Connection, header: TransportHeader):
+    def _handle_handshake_ack(self, conn: Connection):
         # Server-side: Handles the final ACK of the 3-way handshake.
-        print(f"[Conn {conn.conn_id}] Received final ACK. Connection ESTABLISHED.")
+        log.info("[Conn %d] Received final ACK. Connection ESTABLISHED.", conn.conn_id)
         conn.state = ConnectionState.ESTABLISHED
+        conn.established_event.set()
 
         # Notify the server application layer that a new client is ready
         if self.on_new_connection:
             self.on_new_connection(conn)
 
-    def _handle_fin(self, conn: Connection, header: TransportHeader):
+    def _handle_fin(self, conn: Connection, fin_seq: int):
         # Handles a FIN packet from the peer to initiate teardown.
-        print(f"[Conn {conn.conn_id}] Received FIN.")
+        log.info("[Conn %d] Received FIN.", conn.conn_id)
 
         # Acknowledge the FIN
         ack_header = TransportHeader(
             flags=FLAG_ACK,
             conn_id=conn.conn_id,
-            ack=header.seq + 1,
+            ack=fin_seq + 1,
             rwnd=conn.receiver.advertised_window,
         )
         self._send_raw_packet(ack_header, b"", conn.peer_address)
@@ -188,19 +357,19 @@ class TransportProtocol:
     def _cleanup_connection(self, conn: Connection):
         # Removes a connection from the active map and marks it as closed.
         conn.state = ConnectionState.CLOSED
-        if conn.peer_address in self.connections:
-            del self.connections[conn.peer_address]
-            print(f"[Conn {conn.conn_id}] Connection cleaned up.")
+        conn.sender.close()  # Stops its retransmission timer thread
+        if self.connections.pop(conn.peer_address) is not None:
+            log.info("[Conn %d] Connection cleaned up.", conn.conn_id)
 
     # Public API
 
     def connect(self, server_addr: Tuple[str, int], timeout=5.0) -> Connection:
         # Client-side, blocking. Establishes a connection to a server.
-        print(f"Attempting to connect to {server_addr}...")
+        log.info("Attempting to connect to %s...", server_addr)
 
         # 1. Create a local Connection object in SYN_SENT state
         conn = Connection(self, 0, server_addr, ConnectionState.SYN_SENT)
-        self.connections[server_addr] = conn
+        self.connections.put(server_addr, conn)
 
         # 2. Send SYN packet
         syn_header = TransportHeader(
@@ -211,15 +380,12 @@ class TransportProtocol:
         )
         self._send_raw_packet(syn_header, b"", server_addr)
 
-        # 3. Wait for the state to change to ESTABLISHED (or timeout)
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if conn.state == ConnectionState.ESTABLISHED:
-                return conn
-            time.sleep(0.01)  # Poll
+        # 3. Block until _handle_syn_ack signals ESTABLISHED (or timeout)
+        if conn.established_event.wait(timeout):
+            return conn
 
         # 4. If we get here, it timed out
-        print("Connection timed out.")
+        log.warning("Connection timed out.")
         self._cleanup_connection(conn)
         raise TimeoutError("Connection timed out")
 
@@ -242,7 +408,7 @@ class TransportProtocol:
         if conn.state in [ConnectionState.FIN_WAIT, ConnectionState.CLOSED]:
             return
 
-        print(f"[Conn {conn.conn_id}] Sending FIN.")
+        log.info("[Conn %d] Sending FIN.", conn.conn_id)
         conn.state = ConnectionState.FIN_WAIT
 
         fin_header = TransportHeader(
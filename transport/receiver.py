@@ -1,6 +1,13 @@
-from .packet import TransportHeader, FLAG_ACK
+from .packet import AckTemplate
+import logging
 import threading
 
+log = logging.getLogger(__name__)
+
+# Per-packet receive tracing. Off by default; under python -O the guarded blocks are
+# compiled out entirely, since __debug__ is a constant there.
+LOG_RX = False
+
 
 class ReceiverLogic:
     """
@@ -16,32 +23,74 @@ class ReceiverLogic:
         self.conn = conn                      # Reference to Connection object
         self.MAX_BUFFER_SIZE = 64 * 1024      # 64 KB receiver window
         self.buffer = {}                      # seq → payload
+        self.buffered_bytes = 0               # Running total of len(payload) over self.buffer
         self.next_expected_seq = 0            # Next in-order seq we expect
-        self.advertised_window = self.MAX_BUFFER_SIZE
+        self.advertised_window = min(0xFFFF, self.MAX_BUFFER_SIZE)  # Fits the 16-bit rwnd field
         self._lock = threading.Lock()         # Thread safety
+        self._ack_template = None             # Built on first ACK, once conn_id is final
+        self._unacked_segments = 0            # Data segments received since the last ACK
+        self._ack_immediately = False         # Set by duplicates/gaps the sender must hear about
 
 
     # Main entry point – called by protocol._route_packet()
 
-    def process_data_packet(self, header: TransportHeader, payload: bytes):
+    def process_data_packet(self, seq: int, payload: memoryview):
         """Handle an incoming data packet and maintain in-order delivery."""
         with self._lock:
-            seq = header.seq
+            if __debug__ and LOG_RX:
+                log.debug("[Conn %d] Got packet seq=%d, expected=%d",
+                          self.conn.conn_id, seq, self.next_expected_seq)
+            self._unacked_segments += 1
 
-            # 1. Old or duplicate → just ACK current state
+            # 1. Old or duplicate → nothing to store, the next ACK re-states our position
             if seq < self.next_expected_seq:
-                self._send_ack()
+                self._ack_immediately = True
+                return
+
+            # Retransmit of a segment we already hold → keep the first copy
+            if seq in self.buffer:
+                self._ack_immediately = True
                 return
 
+            # Fast path: the next expected segment with nothing held back is handed to
+            # the app directly, skipping the buffer insert/pop and window bookkeeping
+            if seq == self.next_expected_seq and not self.buffer:
+                self.next_expected_seq += len(payload)
+                self._deliver(bytes(payload))
+                return
+
+            # Others are already waiting out of order, so this one may fill the gap
+            if self.buffer:
+                self._ack_immediately = True
+
             # 2. Accept if within our buffer window
             if not self._would_overflow(payload):
-                self.buffer[seq] = payload
+                # Copy out of the receive buffer only once we know we keep the data
+                self.buffer[seq] = bytes(payload)
+                self.buffered_bytes += len(payload)
                 # Try to deliver contiguous data
                 self._deliver_in_order()
             else:
-                print(f"[Conn {self.conn.conn_id}] Buffer full, cannot store seq={seq}")
+                self._ack_immediately = True
+                if __debug__ and LOG_RX:
+                    log.debug("[Conn %d] Buffer full, cannot store seq=%d", self.conn.conn_id, seq)
 
-            # 3. Always send an ACK (cumulative)
+            # Out-of-order arrival leaves a gap → ACK now so the sender sees it quickly
+            if self.buffer:
+                self._ack_immediately = True
+
+            # 3. No ACK here: after each drained batch the listener asks ack_due_now()
+            #    and either calls flush_ack() or delays the ACK (RFC 1122 delayed ACK).
+
+    def ack_due_now(self) -> bool:
+        """True if the pending ACK must not be delayed: every second segment, or a gap/duplicate."""
+        return self._ack_immediately or self._unacked_segments >= 2
+
+    def flush_ack(self):
+        """Send one cumulative ACK covering every packet processed since the last one."""
+        with self._lock:
+            self._unacked_segments = 0
+            self._ack_immediately = False
             self._send_ack()
 
  
@@ -53,30 +102,33 @@ class ReceiverLogic:
 
         while self.next_expected_seq in self.buffer:
             data = self.buffer.pop(self.next_expected_seq)
+            self.buffered_bytes -= len(data)
             self.next_expected_seq += len(data)
             delivered = True
-
-            if self.conn.on_message_callback:
-                try:
-                    self.conn.on_message_callback(data)
-                except Exception as e:
-                    print(f"[Conn {self.conn.conn_id}] on_message_callback error: {e}")
+            self._deliver(data)
 
         if delivered:
             self._update_advertised_window()
 
+    def _deliver(self, data: bytes):
+        """Hand one in-order segment to the app callback."""
+        if self.conn.on_message_callback:
+            try:
+                self.conn.on_message_callback(data)
+            except Exception as e:
+                log.error("[Conn %d] on_message_callback error: %s", self.conn.conn_id, e)
+
 
     # Flow control helpers
 
     def _would_overflow(self, incoming: bytes) -> bool:
         """Return True if adding this payload would exceed MAX_BUFFER_SIZE."""
-        used = sum(len(p) for p in self.buffer.values())
-        return (used + len(incoming)) > self.MAX_BUFFER_SIZE
+        return (self.buffered_bytes + len(incoming)) > self.MAX_BUFFER_SIZE
 
     def _update_advertised_window(self):
         """Recalculate advertised window (rwnd) after deliveries."""
-        used = sum(len(p) for p in self.buffer.values())
-        self.advertised_window = max(0, self.MAX_BUFFER_SIZE - used)
+        # rwnd is a 16-bit header field, so an empty 64 KB buffer advertises 0xFFFF
+        self.advertised_window = min(0xFFFF, max(0, self.MAX_BUFFER_SIZE - self.buffered_bytes))
 
 
     # ACK logic
@@ -84,10 +136,9 @@ class ReceiverLogic:
     def _send_ack(self):
         """Send a pure ACK acknowledging received data."""
         self._update_advertised_window()
-        ack_header = TransportHeader(
-            flags=FLAG_ACK,
-            conn_id=self.conn.conn_id,
-            ack=self.next_expected_seq,
-            rwnd=self.advertised_window
-        )
-        self.conn._internal_send(ack_header, b"")
+        template = self._ack_template
+        if template is None or template.conn_id != self.conn.conn_id:
+            # The client learns its conn_id from the SYN-ACK, so rebuild if it changed
+            template = self._ack_template = AckTemplate(self.conn.conn_id)
+        packet = template.fill(self.next_expected_seq, self.advertised_window)
+        self.conn.protocol._send_bytes(packet, self.conn.peer_address)
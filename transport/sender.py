@@ -1,15 +1,27 @@
 # transport/sender.py
+import heapq
+import logging
 import threading
 import time
-from collections import deque
-from packet import (
-    TransportHeader,
-    FLAG_ACK,
+from collections import OrderedDict, deque
+from .packet import (
+    serialize_fields,
     FLAG_PSH,
 )
 
+log = logging.getLogger(__name__)
+
 MAX_PAYLOAD_SIZE = 1400      # bytes per packet
-RTO_VALUE = 1.0              # Retransmission timeout (seconds)
+RTO_VALUE = 1.0              # Initial retransmission timeout (seconds), before any RTT sample
+
+# RFC 6298 retransmission timer parameters
+RTO_ALPHA = 1 / 8            # SRTT gain
+RTO_BETA = 1 / 4             # RTTVAR gain
+RTO_K = 4
+MIN_RTO = 0.2                # RFC 6298 says 1 s; 200 ms (as in Linux) suits LAN/loopback RTTs
+MAX_RTO = 60.0
+MAX_BACKOFFS = 6             # RTO doublings allowed before forward progress resets them
+RTT_HISTORY = 128            # RTT samples kept per connection for inspection
 
 
 class SenderLogic:
@@ -19,24 +31,48 @@ class SenderLogic:
         self.connection = connection
         self.next_seq = 0                      # Next sequence number to use
         self.base_seq = 0                      # Oldest un-ACKed packet
-        self.send_buffer = deque()             # Queue of payloads waiting to send
-        self.unacked_packets = {}              # seq -> (packet, timer)
+        self.send_buffer = deque()             # Queued messages, each sent in MAX_PAYLOAD_SIZE slices
+        self.send_offset = 0                   # Bytes of send_buffer[0] already packetized
+        # seq -> (packet, deadline, send_time, retransmitted), in send (= seq) order, so ACKs
+        # pop from the front; re-arming a retransmit keeps the entry in place
+        self.unacked_packets = OrderedDict()
         self.lock = threading.Lock()
         self.advertised_window = 4096          # Updated by receiver ACKs
         
         self.bytes_sent = 0
         self.retransmissions = 0
-        self.rtt_samples = []
+        self.rtt_samples = deque(maxlen=RTT_HISTORY)  # Recent samples for stats; RTO uses srtt/rttvar
+
+        # Adaptive RTO (RFC 6298); srtt/rttvar stay None until the first valid sample
+        self.srtt = None
+        self.rttvar = None
+        self.rto = RTO_VALUE
+        self.backoffs = 0                      # Consecutive RTO doublings without base_seq advancing
+
+        # One timer thread per connection instead of one threading.Timer per packet.
+        # It sleeps on timer_cv until the earliest deadline in timer_heap.
+        self.timer_heap = []                   # (deadline, seq) min-heap, time.monotonic() based
+        self.timer_cv = threading.Condition(self.lock)
+        self.timer_thread = None               # Started on the first send
+        self.closed = False
 
     # ----------------------------------------------------
     #  Called by Part 2 send_msg()
     # ----------------------------------------------------
     def queue_data_for_sending(self, data: bytes):
-        """Break large data into chunks and queue them for sending."""
-        for i in range(0, len(data), MAX_PAYLOAD_SIZE):
-            chunk = data[i:i + MAX_PAYLOAD_SIZE]
-            self.send_buffer.append(chunk)
-        print(f"[Sender {self.connection.conn_id}] Queued {len(data)} bytes for sending.")
+        """Queue a message for sending; it is cut into packets as the window allows."""
+        if not data:
+            return  # An empty segment would reuse the next segment's seq
+        # Mutable input is snapshotted so later changes by the caller can't reach queued data
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if len(data) > MAX_PAYLOAD_SIZE:
+            # Queued whole, as one entry; the send loop slices it at send_offset, and the
+            # memoryview makes each slice a zero-copy view
+            data = memoryview(data)
+        self.send_buffer.append(data)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[Sender %d] Queued %d bytes for sending.", self.connection.conn_id, len(data))
         self.send_buffered_data()
 
     # ----------------------------------------------------
@@ -44,71 +80,234 @@ class SenderLogic:
     # ----------------------------------------------------
     def send_buffered_data(self):
         with self.lock:
-            while (self.next_seq - self.base_seq) < self.advertised_window and self.send_buffer:
-                payload = self.send_buffer.popleft()
-                header = TransportHeader(
-                    ver=1,
-                    flags=FLAG_PSH,
-                    conn_id=self.connection.conn_id,
-                    seq=self.next_seq,
-                    ack=0,
-                    rwnd=0,
-                    length=len(payload)
-                )
-
-                self.connection._internal_send(header, payload)
-                print(f"[Sender {self.connection.conn_id}] Sent packet seq={self.next_seq}")
-
-                self.bytes_sent += len(payload)
-
-                # Start retransmission timer
-                self.start_rto_timer(payload, self.next_seq)
-                self.next_seq += len(payload)
+            batch = self._fill_window_locked()
+        self._send_batch(batch)
+
+    def _send_batch(self, batch: list):
+        # Called without self.lock: the packets are already registered in unacked_packets, so
+        # the socket writes don't hold up ACK processing or the timer thread
+        if batch:
+            self.connection.protocol._send_raw_batch(batch, self.connection.peer_address)
+
+    def _fill_window_locked(self) -> list:
+        # Caller holds self.lock. Serializes every packet the window allows, arms their timers
+        # and returns them for the caller to send once the lock is released.
+        batch = []
+        # Bound once up front: this loop runs per packet, and each self./module lookup costs
+        send_buffer = self.send_buffer
+        popleft = send_buffer.popleft
+        append = batch.append
+        start_rto_timer = self.start_rto_timer
+        conn_id = self.connection.conn_id
+        limit = self.base_seq + self.advertised_window
+        debug = log.isEnabledFor(logging.DEBUG)
+        next_seq = self.next_seq
+        sent = 0
+        while next_seq < limit and send_buffer:
+            data = send_buffer[0]
+            if len(data) <= MAX_PAYLOAD_SIZE:
+                # Fits one packet; small messages are queued as-is, so no slicing
+                payload = popleft()
+            else:
+                start = self.send_offset
+                end = start + MAX_PAYLOAD_SIZE
+                payload = data[start:end]
+                if end >= len(data):
+                    popleft()
+                    self.send_offset = 0
+                else:
+                    self.send_offset = end
+
+            # Serialized once, straight from the field values; retransmits resend these bytes
+            packet = serialize_fields(FLAG_PSH, conn_id, next_seq, 0, 0, payload)
+            append(packet)
+            if debug:
+                log.debug("[Sender %d] Sent packet seq=%d", conn_id, next_seq)
+
+            sent += len(payload)
+
+            # Start retransmission timer
+            start_rto_timer(packet, next_seq)
+            next_seq += len(payload)
+        self.next_seq = next_seq
+        self.bytes_sent += sent
+        return batch
 
     # ----------------------------------------------------
     #  Retransmission timer handling
     # ----------------------------------------------------
-    def start_rto_timer(self, header, payload: bytes, seq_num: int):
-        timer = threading.Timer(RTO_VALUE, self.on_rto_expired, args=[payload, seq_num])
-        timer.daemon = True
-        timer.start()
-        current_time = time.time()
-        self.unacked_packets[seq_num] = (header, payload, timer, current_time)
-
-    def on_rto_expired(self, header, payload: bytes, seq_num: int):
-        """Called when an ACK hasn't arrived in time."""
-        with self.lock:
-            if seq_num in self.unacked_packets:
-                print(f"[Sender {self.connection.conn_id}] Timeout → retransmitting seq={seq_num}")
-                self.retransmissions += 1
-                self.connection.internal_send(header, payload)
-                # self.connection.protocol._send_raw_packet(None, payload, self.connection.peer_address)
-                # restart timer
-                self.start_rto_timer(header, payload, seq_num)
+    def start_rto_timer(self, packet: bytes, seq_num: int):
+        # Caller holds self.lock
+        # One monotonic reading for both: wall-clock steps (NTP, manual changes) can't skew RTTs
+        now = time.monotonic()
+        deadline = now + self.rto
+        self.unacked_packets[seq_num] = (packet, deadline, now, False)
+        heap = self.timer_heap
+        was_earliest = not heap or deadline < heap[0][0]
+        heapq.heappush(heap, (deadline, seq_num))
+        if self.timer_thread is None:
+            self.timer_thread = threading.Thread(target=self._timer_loop, daemon=True)
+            self.timer_thread.start()
+        elif was_earliest:
+            self.timer_cv.notify()  # The timer thread is sleeping towards a later deadline
+
+    def _timer_loop(self):
+        """Timer thread: retransmits every packet whose deadline passes unacknowledged."""
+        heappop = heapq.heappop
+        while True:
+            with self.timer_cv:
+                expired = []
+                while not expired:
+                    if self.closed:
+                        return
+                    if not self.timer_heap:
+                        self.timer_cv.wait()
+                        continue
+                    now = time.monotonic()
+                    delay = self.timer_heap[0][0] - now
+                    if delay > 0:
+                        self.timer_cv.wait(delay)
+                        continue
+                    # Drain everything due at this wakeup into one retransmission event
+                    heap = self.timer_heap
+                    unacked = self.unacked_packets
+                    while heap and heap[0][0] <= now:
+                        deadline, seq_num = heappop(heap)
+                        entry = unacked.get(seq_num)
+                        # Skip entries for ACKed packets and for deadlines superseded by a retransmit
+                        if entry is not None and entry[1] == deadline:
+                            expired.append((seq_num, entry[0]))
+                batch = self.on_rto_expired(expired, now)
+            # Like first sends, retransmits go out after the lock is released
+            self._send_batch(batch)
+
+    def on_rto_expired(self, expired: list, now: float) -> list:
+        """Called by the timer thread, with self.lock held, for all (seq, packet) pairs that
+        timed out at one wakeup.
+
+        Backs off at most once for the whole event, re-arms every packet with the same new deadline
+        and returns the packets; the caller sends them once the lock is released.
+        """
+        unacked = self.unacked_packets
+        # Deadlines are fixed when armed, so a later segment can expire before the hole at the
+        # front of the window; that segment is what the receiver is waiting on, so resend it too
+        oldest = next(iter(unacked))
+        oldest_expired = any(seq_num == oldest for seq_num, _ in expired)
+        if not oldest_expired:
+            expired.append((oldest, unacked[oldest][0]))
+
+        # Back off at most once per event, and only when the oldest segment's own timer ran
+        # out: that is the timer TCP keeps, and later segments expiring in between must not
+        # compound it. Any ACK that moves base_seq resets the backoff.
+        if oldest_expired and self.backoffs < MAX_BACKOFFS:
+            self.backoffs += 1
+            self.rto = min(self.rto * 2, MAX_RTO)
+            log.info("[Sender %d] Retransmission timeout at seq=%d, RTO backed off to %.3fs",
+                     self.connection.conn_id, oldest, self.rto)
+        elif log.isEnabledFor(logging.DEBUG):
+            log.debug("[Sender %d] Timeout → retransmitting %d packet(s) from seq=%d",
+                      self.connection.conn_id, len(expired), oldest)
+        self.retransmissions += len(expired)
+
+        # restart timers; Karn's rule: these segments no longer yield RTT samples. The shared
+        # deadline is later than anything in the heap, so each push is an append, not a sift.
+        deadline = now + self.rto
+        heappush = heapq.heappush
+        heap = self.timer_heap
+        batch = []
+        for seq_num, packet in expired:
+            unacked[seq_num] = (packet, deadline, now, True)
+            heappush(heap, (deadline, seq_num))
+            batch.append(packet)
+        return batch
+
+    def close(self):
+        """Stop the timer thread; called when the connection is cleaned up."""
+        with self.timer_cv:
+            self.closed = True
+            self.timer_heap.clear()
+            self.unacked_packets.clear()
+            self.timer_cv.notify()
 
     # ----------------------------------------------------
     #  ACK handling
     # ----------------------------------------------------
-    def process_incoming_ack(self, header: TransportHeader):
+    def process_incoming_ack(self, ack_num: int, rwnd: int):
         """Handle cumulative ACKs."""
-        ack_num = header.ack
-        print(f"[Sender {self.connection.conn_id}] Received ACK={ack_num}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[Sender %d] Received ACK=%d", self.connection.conn_id, ack_num)
         with self.lock:
-            # Remove all packets fully acknowledged
-            to_remove = [seq for seq in self.unacked_packets if seq < ack_num]
-            for seq in to_remove:
-                header, payload, timer, send_time = self.unacked_packets.pop(seq)
-                if isinstance(timer, threading.Timer):
-                    timer.cancel()
-                    
-                rtt = time.time() - send_time
+            # Remove all packets fully acknowledged; their heap entries are skipped when popped.
+            # Only the newly ACKed front of the window is touched, not every in-flight packet.
+            unacked = self.unacked_packets
+            now = time.monotonic()
+            rtt = None
+            while unacked:
+                seq = next(iter(unacked))
+                if seq >= ack_num:
+                    break
+                packet, deadline, send_time, retransmitted = unacked.popitem(last=False)[1]
+                if retransmitted:
+                    continue  # Karn's rule: ambiguous which transmission was ACKed
+
+                sample = now - send_time
+                if sample <= 0:
+                    continue  # Only clock granularity could cause this; never feed it to the RTO
+                rtt = sample
                 self.rtt_samples.append(rtt)
-                
-                print(f"[Sender {self.connection.conn_id}] Packet seq={seq} ACKed. RTT={rtt:.4f}s")
+
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("[Sender %d] Packet seq=%d ACKed. RTT=%.4fs",
+                              self.connection.conn_id, seq, rtt)
+
+            # One RTO update per ACK, from the last segment it newly covers
+            if rtt is not None:
+                self._update_rto(rtt)
+
+            if ack_num > self.base_seq:
+                # Forward progress ends a backoff even when Karn's rule leaves no sample;
+                # otherwise every new hole would double an RTO that is already backed off
+                if self.backoffs:
+                    self.backoffs = 0
+                    self.rto = self._base_rto()
+                # Restart the timer for the new oldest segment (RFC 6298 section 5.3)
+                if unacked:
+                    self._rearm_oldest(now)
 
             # Slide window forward
             self.base_seq = ack_num
-            self.advertised_window = header.rwnd
+            self.advertised_window = rwnd
 
             # Try to send more if window opened
-            self.send_buffered_data()
+            batch = self._fill_window_locked()
+        self._send_batch(batch)
+
+    def _update_rto(self, rtt: float):
+        """Fold one RTT sample into SRTT/RTTVAR and recompute the RTO (RFC 6298 section 2)."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            # RTTVAR must be updated with the old SRTT, so it goes first
+            self.rttvar = (1 - RTO_BETA) * self.rttvar + RTO_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTO_ALPHA) * self.srtt + RTO_ALPHA * rtt
+        self.rto = self._base_rto()
+        self.backoffs = 0
+
+    def _base_rto(self) -> float:
+        """RTO from the current estimates, without any backoff."""
+        if self.srtt is None:
+            return RTO_VALUE
+        return min(max(self.srtt + RTO_K * self.rttvar, MIN_RTO), MAX_RTO)
+
+    def _rearm_oldest(self, now: float):
+        # Caller holds self.lock. Moves the front segment's deadline to now + RTO; its old heap
+        # entry no longer matches and is skipped when popped.
+        seq_num = next(iter(self.unacked_packets))
+        packet, _, send_time, retransmitted = self.unacked_packets[seq_num]
+        deadline = now + self.rto
+        self.unacked_packets[seq_num] = (packet, deadline, send_time, retransmitted)
+        heap = self.timer_heap
+        heapq.heappush(heap, (deadline, seq_num))
+        if heap[0][1] == seq_num and heap[0][0] == deadline:
+            self.timer_cv.notify()  # Earlier than what the timer thread is sleeping towards